@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 from utils.io import load_and_clean_data
+from utils.prep import get_facets, filter_data, compute_kpis
 from utils.viz import get_pydeck_map, get_plotly_bar_chart, get_plotly_hist
 
 # --- CONFIGURATION DE LA PAGE ---
@@ -16,6 +17,22 @@ if data.empty:
     st.error("Impossible de charger les données. Vérifiez le fichier source.")
     st.stop()
 
+facets = get_facets(data)
+
+
+# --- CARTE (FRAGMENT) ---
+@st.fragment
+def render_map(df_filtered):
+    """
+    Carte isolée dans un fragment : changer son style ne relance que ce bloc,
+    pas les KPIs ni les graphiques.
+    """
+    st.subheader("Où sont les bornes ?")
+    use_dark_mode = st.toggle("Activer le mode nuit 🌙", value=False)
+    map_style_to_use = 'mapbox://styles/mapbox/navigation-night-v1' if use_dark_mode else 'mapbox://styles/mapbox/navigation-day-v1'
+    get_pydeck_map(df_filtered, map_style=map_style_to_use)
+
+
 # --- TITRE ET SOURCE ---
 st.title("Data Storytelling : Le réseau de bornes derecharge (IRVE) en France")
 st.caption("Source : data.gouv.fr (https://www.data.gouv.fr/datasets/base-nationale-des-irve-infrastructures-de-recharge-pour-vehicules-electriques)")
@@ -25,7 +42,7 @@ with st.sidebar:
     st.header("Filtres")
 
     # Filtre 1 : Opérateur
-    all_operators = sorted(data['nom_operateur'].dropna().unique())
+    all_operators = facets['ops']
     select_all_operators = st.checkbox("Sélectionner tous les opérateurs", value=True)
     default_ops = all_operators if select_all_operators else []
     selected_operators = st.multiselect(
@@ -35,8 +52,8 @@ with st.sidebar:
     )
 
     # Filtre 2 : Puissance
-    min_power = int(data['puissance_nominale'].min())
-    max_power = int(data['puissance_nominale'].max())
+    min_power = facets['pmin']
+    max_power = facets['pmax']
     selected_power = st.slider(
         "Puissance nominale (kW)",
         min_value=min_power,
@@ -45,50 +62,44 @@ with st.sidebar:
     )
 
     # Filtre 3 : Gratuité
-    all_gratuite_options = ['Tous'] + list(data['gratuit'].unique())
+    all_gratuite_options = ['Tous'] + facets['gratuit']
     selected_gratuite = st.radio(
         "Borne gratuite ?",
         options=all_gratuite_options,
         index=0
     )
 
-    st.divider()
-    st.subheader("Options de la carte")
-    use_dark_mode = st.toggle("Activer le mode nuit 🌙", value=False)
-    map_style_to_use = 'mapbox://styles/mapbox/navigation-night-v1' if use_dark_mode else 'mapbox://styles/mapbox/navigation-day-v1'
-
 # --- FILTRAGE DES DONNÉES ---
-df_filtered = data[
-    (data['nom_operateur'].isin(selected_operators)) &
-    (data['puissance_nominale'] >= selected_power[0]) &
-    (data['puissance_nominale'] <= selected_power[1])
-]
-
-if selected_gratuite != 'Tous':
-    df_filtered = df_filtered[df_filtered['gratuit'] == selected_gratuite]
+df_filtered = filter_data(
+    data,
+    tuple(selected_operators),
+    selected_power[0],
+    selected_power[1],
+    selected_gratuite
+)
 
 # --- CORPS DE L'APPLICATION ---
 
 # Section 1 : Indicateurs Clés (KPIs)
 st.header("📈 L'état du réseau en un coup d'œil")
 kpi1, kpi2, kpi3 = st.columns(3)
+n_stations, total_pdc, mean_power = compute_kpis(df_filtered)
 
 with kpi1:
     st.metric(
         label="Nombre de Stations",
-        value=f"{len(df_filtered):,}".replace(',', ' '),
+        value=f"{n_stations:,}".replace(',', ' '),
         help="Nombre de stations uniques correspondant aux filtres."
     )
 
 with kpi2:
     st.metric(
         label="Nombre total de Points de Charge (PDC)",
-        value=f"{int(df_filtered['nbre_pdc'].sum()):,}".replace(',', ' '),
+        value=f"{total_pdc:,}".replace(',', ' '),
         help="Nombre total de points de charge (une station peut avoir plusieurs PDC)."
     )
 
 with kpi3:
-    mean_power = df_filtered['puissance_nominale'].mean()
     st.metric(
         label="Puissance Moyenne (kW)",
         value=f"{mean_power:.1f} kW" if not pd.isna(mean_power) else "N/A",
@@ -103,8 +114,7 @@ st.header("🗺️ Analyse détaillée")
 col1, col2 = st.columns([2, 1])
 
 with col1:
-    st.subheader("Où sont les bornes ?")
-    get_pydeck_map(df_filtered, map_style=map_style_to_use)
+    render_map(df_filtered)
 
 with col2:
     st.subheader("Top 10 Opérateurs")
@@ -125,11 +135,12 @@ get_plotly_hist(
 st.divider()
 st.header("🔍 Qualité des données & Limites")
 st.markdown("### Aperçu des données filtrées")
-st.dataframe(df_filtered.head(10))
+st.dataframe(df_filtered.head(10), width='stretch')
 
 with st.expander("Limitations et Biais (Mis à jour)"):
     st.info("""
         - **Nettoyage :** Les données ont été nettoyées...
         - **Puissance :** Les outliers (au-dessus du 99.9e percentile) ont été exclus.
+        - **Géographie :** Seules les bornes de France métropolitaine sont conservées (DOM-TOM exclus).
         - **Opérateurs :** Les noms ont été normalisés.
     """)
@@ -1,20 +1,120 @@
+from pathlib import Path
+
 import streamlit as st
+import numpy as np
 import pandas as pd
 
 
+# Seules ces colonnes du CSV IRVE sont utilisées par l'application
+NEEDED_COLS = [
+    'consolidated_latitude',
+    'consolidated_longitude',
+    'puissance_nominale',
+    'nbre_pdc',
+    'nom_operateur',
+    'gratuit',
+    'date_mise_en_service',
+    'code_insee_commune',
+    'nom_station',
+]
+
+# Types imposés à la lecture (évite le typage "object" puis les conversions)
+DTYPES = {
+    'nom_operateur': 'category',
+    'gratuit': 'category',
+    'code_insee_commune': 'string',
+    'nom_station': 'string',
+}
+
+# Colonnes numériques : lues sans type imposé puis converties une seule fois,
+# une cellule invalide (ex: '7,4') devient NaN au lieu de faire échouer la lecture
+FLOAT_COLS = ['consolidated_latitude', 'consolidated_longitude', 'puissance_nominale']
+INT_COLS = ['nbre_pdc']
+
+
+def coerce_numeric(df):
+    """Convertit les colonnes numériques en float32 / Int16, les valeurs invalides en NaN."""
+    for col in FLOAT_COLS:
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype('float32')
+    for col in INT_COLS:
+        values = pd.to_numeric(df[col], errors='coerce')
+        # Les valeurs non entières ou hors de l'intervalle Int16 sont aussi invalides
+        valid = (values % 1 == 0) & values.between(0, np.iinfo(np.int16).max)
+        df[col] = values.where(valid).astype('Int16')
+    return df
+
+
+def read_irve_csv(csv_path):
+    """
+    Lit le CSV avec le moteur pyarrow (multi-thread), ou le moteur C par défaut
+    si pyarrow n'est pas installé.
+    """
+    read_kwargs = dict(
+        usecols=NEEDED_COLS,
+        dtype=DTYPES,
+        parse_dates=['date_mise_en_service']
+    )
+    try:
+        df = pd.read_csv(csv_path, engine='pyarrow', **read_kwargs)
+    except ImportError:
+        df = pd.read_csv(csv_path, low_memory=False, **read_kwargs)
+    return coerce_numeric(df)
+
+
+def is_parquet_fresh(parquet_path, csv_path):
+    """Le Parquet nettoyé est réutilisable s'il existe et n'est pas plus ancien que le CSV."""
+    if not parquet_path.exists():
+        return False
+    if not csv_path.exists():
+        return True
+    return parquet_path.stat().st_mtime >= csv_path.stat().st_mtime
+
+
+def cleaned_parquet_path(csv_path, version):
+    """Chemin du Parquet nettoyé, propre à une version des règles de nettoyage."""
+    return csv_path.with_name(f"{csv_path.stem}.v{version}.parquet")
+
+
 @st.cache_data(show_spinner="Chargement et nettoyage des données...")
-def load_and_clean_data(csv_path):
+def read_and_clean_data(csv_path):
     """
     Charge les données depuis un CSV et lance le pipeline de nettoyage complet.
+    Le résultat nettoyé est sauvegardé en Parquet à côté du CSV et relu
+    directement aux lancements suivants.
+    Les erreurs de lecture sont propagées : un échec n'est jamais mis en cache.
+    """
+    from .prep import clean_data, CLEANING_VERSION
+
+    csv_path = Path(csv_path)
+    parquet_path = cleaned_parquet_path(csv_path, CLEANING_VERSION)
+
+    if is_parquet_fresh(parquet_path, csv_path):
+        try:
+            return pd.read_parquet(parquet_path)
+        except Exception:
+            # Parquet illisible (fichier corrompu, moteur absent...) : on repart du CSV
+            pass
+
+    df = clean_data(read_irve_csv(csv_path))
+
+    try:
+        df.to_parquet(parquet_path, compression='snappy')
+    except (OSError, ImportError):
+        # Dossier en lecture seule ou moteur Parquet absent : on se passe du cache disque
+        pass
+
+    return df
+
+
+def load_and_clean_data(csv_path):
+    """
+    Charge les données nettoyées (via le cache) et affiche l'erreur éventuelle.
+    Renvoie un DataFrame vide en cas d'échec, sans que cet échec soit mis en cache.
     """
     try:
-        df = pd.read_csv(csv_path, low_memory=False)
+        return read_and_clean_data(csv_path)
     except FileNotFoundError:
         st.error(f"Erreur : Le fichier '{csv_path}' est introuvable.")
-        return pd.DataFrame()
     except Exception as e:
         st.error(f"Erreur inattendue lors du chargement des données : {e}")
-        return pd.DataFrame()
-
-    from .prep import clean_data
-    return clean_data(df)
\ No newline at end of file
+    return pd.DataFrame()
@@ -1,44 +1,98 @@
+import numpy as np
 import pandas as pd
+import streamlit as st
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+# Version des règles de nettoyage : à incrémenter à chaque modification de
+# clean_data ou de ses étapes, pour invalider le Parquet nettoyé (cf. utils/io.py)
+CLEANING_VERSION = 1
+
+# Copy-on-Write (toujours actif à partir de pandas 3) : les sélections de lignes
+# et les renommages ne recopient les données qu'en cas de modification
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+
+# Emprise de la France métropolitaine
+METRO_LAT = (40, 52)
+METRO_LON = (-5, 10)
 
 
 def clean_location(df):
-    """Nettoie et valide les données de géolocalisation."""
-    df.rename(columns={
+    """Renomme les colonnes de géolocalisation."""
+    return df.rename(columns={
         'consolidated_latitude': 'lat',
         'consolidated_longitude': 'lon'
-    }, inplace=True)
+    })
 
-    df.dropna(subset=['lat', 'lon'], inplace=True)
-    df['lat'] = pd.to_numeric(df['lat'], errors='coerce')
-    df['lon'] = pd.to_numeric(df['lon'], errors='coerce')
-    df.dropna(subset=['lat', 'lon'], inplace=True)
-    return df
 
+def metro_mask(lat, lon):
+    """
+    Masque des points situés en France métropolitaine.
+    Les coordonnées manquantes (NaN) sont exclues par les comparaisons.
+    """
+    mask = lat >= METRO_LAT[0]
+    mask &= lat <= METRO_LAT[1]
+    mask &= lon >= METRO_LON[0]
+    mask &= lon <= METRO_LON[1]
+    return mask
 
-def clean_numerical_data(df):
-    """Nettoie les colonnes numériques et filtre les outliers."""
-    df['puissance_nominale'] = pd.to_numeric(df['puissance_nominale'], errors='coerce')
-    df['nbre_pdc'] = pd.to_numeric(df['nbre_pdc'], errors='coerce')
 
-    if not df['puissance_nominale'].empty:
-        p_999 = df['puissance_nominale'].quantile(0.999)
-        df = df[(df['puissance_nominale'] <= p_999) | (df['puissance_nominale'].isna())].copy()
+def filter_rows(df):
+    """
+    Ne conserve que les bornes géolocalisées en métropole et dont la puissance
+    n'est pas aberrante (au-dessus du 99.9e percentile).
+    Les deux conditions sont réunies dans un seul masque : une seule sélection de lignes.
+    """
+    power = df['puissance_nominale'].to_numpy()
+    mask = metro_mask(df['lat'].to_numpy(), df['lon'].to_numpy())
+    is_nan = np.isnan(power)
+    values = power[mask & ~is_nan]
 
-    return df
+    if values.size:
+        # Sélection partielle (O(N)) du 99.9e percentile, sans trier toute la colonne
+        k = int(np.ceil(0.999 * (values.size - 1)))
+        p_999 = np.partition(values, k)[k]
+        keep_power = power <= p_999
+        keep_power |= is_nan
+        mask &= keep_power
+
+    return df[mask]
+
+
+def normalize_labels(labels):
+    """Supprime les espaces autour des libellés et les met en majuscules."""
+    labels = labels.astype(str)
+    if pc is None:
+        return labels.str.strip().str.upper().to_numpy()
+
+    # Noyaux Arrow : une passe C++ sur un buffer contigu
+    arr = pa.array(labels.to_numpy(), type=pa.string())
+    return pc.utf8_upper(pc.utf8_trim_whitespace(arr)).to_numpy(zero_copy_only=False)
 
 
 def clean_text_data(df):
     """Normalise les colonnes de texte (ex: opérateurs)."""
-    df['nom_operateur'] = df['nom_operateur'].fillna('Inconnu')
-    df['nom_operateur'] = df['nom_operateur'].astype(str).str.strip().str.upper()
+    # La normalisation porte sur les modalités distinctes, pas sur chaque ligne
+    operators = df['nom_operateur'].astype('category')
+    levels = np.append(normalize_labels(operators.cat.categories), 'INCONNU')
+
+    # Plusieurs modalités brutes peuvent donner le même libellé (ex: ' Tesla' et 'TESLA')
+    labels, level_codes = np.unique(levels, return_inverse=True)
+
+    # Le code -1 (valeur manquante) pointe sur le dernier élément : 'INCONNU'
+    codes = level_codes[operators.cat.codes.to_numpy()]
+    df['nom_operateur'] = pd.Categorical.from_codes(codes, categories=labels)
     return df
 
 
 def clean_categorical_data(df):
     """Nettoie et standardise les colonnes catégorielles."""
-    # On convertit tout en string pour éviter les problèmes de type
-    df['gratuit'] = df['gratuit'].astype(str).str.strip().str.lower()
-
     mapping = {
         'true': 'Oui',
         '1': 'Oui',
@@ -47,49 +101,58 @@ def clean_categorical_data(df):
         '0': 'Non',
         'non': 'Non'
     }
+    levels = ['Oui', 'Non', 'Inconnu']
+
+    # On standardise les modalités distinctes (et non chaque ligne)
+    gratuit = df['gratuit'].astype('category')
+    raw_levels = gratuit.cat.categories.astype(str).str.strip().str.lower()
+    level_codes = pd.Index(levels).get_indexer(raw_levels.map(mapping).fillna('Inconnu'))
 
-    df['gratuit'] = df['gratuit'].map(mapping)
-    df['gratuit'] = df['gratuit'].fillna('Inconnu')
+    # Le code -1 (valeur manquante) pointe sur le dernier élément : 'Inconnu'
+    lookup = np.append(level_codes, levels.index('Inconnu'))
+    df['gratuit'] = pd.Categorical.from_codes(lookup[gratuit.cat.codes.to_numpy()], categories=levels)
     return df
 
 
 def clean_temporal_data(df):
     """Nettoie et convertit les colonnes de date."""
-    df['date_mise_en_service'] = pd.to_datetime(df['date_mise_en_service'], errors='coerce')
+    # Les dates sont parsées à la lecture du CSV (parse_dates) ; on ne reconvertit
+    # que si des valeurs invalides ont laissé la colonne en texte
+    if not pd.api.types.is_datetime64_any_dtype(df['date_mise_en_service']):
+        df['date_mise_en_service'] = pd.to_datetime(df['date_mise_en_service'], errors='coerce')
     return df
 
 
 def feature_engineer_power(df):
     """Crée des catégories de puissance parlantes."""
-    bins = [0, 11, 50, 150, float('inf')]
+    bins = np.array([0, 11, 50, 150, np.inf], dtype=np.float32)
     labels = ['Charge Lente (<11kW)', 'Charge Accélérée (11-50kW)', 'Charge Rapide (50-150kW)',
-              'Charge Ultra-Rapide (>150kW)']
-
-    df['categorie_puissance'] = pd.cut(
-        df['puissance_nominale'],
-        bins=bins,
-        labels=labels,
-        right=False  # 11kW est dans [11-50kW)
-    )
-    df['categorie_puissance'] = df['categorie_puissance'].cat.add_categories('Inconnue').fillna('Inconnue')
+              'Charge Ultra-Rapide (>150kW)', 'Inconnue']
+
+    # np.digitize renvoie 1..4 pour les intervalles [0, 11), [11, 50)... (11kW est dans [11-50kW))
+    # 0 sous le premier bord, 5 au-delà du dernier et pour NaN : tout ce qui sort -> 'Inconnue'
+    idx = np.digitize(df['puissance_nominale'].to_numpy(), bins, right=False).astype(np.int8)
+    codes = np.where((idx >= 1) & (idx <= 4), idx - 1, labels.index('Inconnue')).astype(np.int8)
+    df['categorie_puissance'] = pd.Categorical.from_codes(codes, categories=labels)
     return df
 
 
 def feature_engineer_time(df):
     """Extrait l'année de mise en service."""
-    df['annee_mes'] = df['date_mise_en_service'].dt.year.fillna(0).astype(int)
-    df['annee_mes'] = df['annee_mes'].replace(0, pd.NA)
+    # Le type entier nullable conserve les dates manquantes (NaT -> <NA>)
+    df['annee_mes'] = df['date_mise_en_service'].dt.year.astype('Int16')
     return df
 
 
 def feature_engineer_geo(df):
     """Extrait le code département depuis le code INSEE."""
-    # Le code INSEE (ex: '75010') doit être un str
+    # Le code INSEE (ex: '75010') est converti en string, ce qui conserve les
+    # codes Corse '2A' et '2B' ; les zéros de tête, eux, peuvent être perdus à la
+    # lecture (le moteur pyarrow infère le type avant la conversion : '01001' -> '1001')
     # On s'assure qu'il est sur 5 caractères (ex: '1001' devient '01001')
-    # On prend les 2 premiers chiffres (ex: '01' pour l'Ain)
-    df['code_departement'] = df['code_insee_commune'].astype(str).str.zfill(5).str[:2]
-    # Gérer les codes Corse '2A' et '2B' (qui sont '20' dans le code INSEE)
-    df.loc[df['code_departement'] == '20', 'code_departement'] = df['code_insee_commune'].str[:2]
+    # On prend les 2 premiers caractères (ex: '01' pour l'Ain)
+    codes = df['code_insee_commune'].astype('string').str.zfill(5)
+    df['code_departement'] = codes.str.slice(0, 2).astype('category')
     return df
 
 
@@ -98,7 +161,7 @@ def clean_data(df):
     Pipeline principal de nettoyage et de préparation.
     """
     df = clean_location(df)
-    df = clean_numerical_data(df)
+    df = filter_rows(df)
     df = clean_text_data(df)
     df = clean_categorical_data(df)
     df = clean_temporal_data(df)
@@ -107,4 +170,47 @@ def clean_data(df):
     df = feature_engineer_time(df)
     df = feature_engineer_geo(df)
 
-    return df
\ No newline at end of file
+    return df
+
+
+@st.cache_data
+def get_facets(df):
+    """
+    Calcule une seule fois les valeurs proposées par les filtres de la sidebar.
+    """
+    return {
+        'ops': sorted(df['nom_operateur'].dropna().unique().tolist()),
+        'pmin': int(df['puissance_nominale'].min()),
+        'pmax': int(df['puissance_nominale'].max()),
+        'gratuit': df['gratuit'].unique().tolist()
+    }
+
+
+def filter_data(df, operators, power_min, power_max, gratuite):
+    """
+    Applique les filtres de la sidebar en un seul masque.
+    Pas de cache : relire un résultat mis en cache coûte plus cher que ce calcul.
+    """
+    # Comparaison sur les codes entiers de la catégorie plutôt que sur les chaînes
+    operator_col = df['nom_operateur']
+    selected_codes = np.flatnonzero(operator_col.cat.categories.isin(operators))
+
+    mask = np.isin(operator_col.cat.codes.to_numpy(), selected_codes)
+    mask &= df['puissance_nominale'].between(power_min, power_max, inclusive='both').to_numpy()
+    if gratuite != 'Tous':
+        mask &= (df['gratuit'] == gratuite).to_numpy()
+
+    return df[mask]
+
+
+def compute_kpis(df):
+    """
+    Calcule les indicateurs clés (nombre de stations, total de PDC, puissance moyenne)
+    directement sur les tableaux numpy, sans passer par les réductions pandas.
+    """
+    pdc = df['nbre_pdc'].to_numpy(dtype=np.float64, na_value=np.nan)
+    power = df['puissance_nominale'].to_numpy()
+
+    n_power = np.count_nonzero(~np.isnan(power))
+    mean_power = np.nansum(power, dtype=np.float64) / n_power if n_power else np.nan
+    return len(df), int(np.nansum(pdc)), mean_power
@@ -1,21 +1,41 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import pydeck as pdk
 import plotly.express as px
 
+# Au-delà de ce nombre de bornes, les points sont agrégés en hexagones
+MAX_SCATTER_POINTS = 20_000
+# Taille (en degrés, ~2 km) de la grille de pré-agrégation côté serveur
+GRID_CELL_DEG = 0.02
 
-def get_pydeck_map(df, map_style='mapbox://styles/mapbox/navigation-day-v1'):
+
+def bin_points(df, cell_deg=GRID_CELL_DEG):
     """
-    Crée une carte Pydeck centrée sur la France avec les points des bornes.
-    Utilise la clé API Mapbox des secrets Streamlit.
+    Regroupe les bornes sur une grille régulière et renvoie le centre de chaque
+    cellule non vide avec son nombre de bornes (bien moins de lignes à envoyer).
     """
-    if df.empty:
-        st.warning("Aucune donnée à afficher sur la carte pour les filtres sélectionnés.")
-        return
+    lat_idx = np.floor(df['lat'].to_numpy() / cell_deg).astype(np.int64)
+    lon_idx = np.floor(df['lon'].to_numpy() / cell_deg).astype(np.int64)
+    cells, counts = np.unique(np.column_stack([lat_idx, lon_idx]), axis=0, return_counts=True)
+    return pd.DataFrame({
+        'lat': (cells[:, 0] + 0.5) * cell_deg,
+        'lon': (cells[:, 1] + 0.5) * cell_deg,
+        'count': counts
+    })
 
-    # Récupère la clé API
-    mapbox_api_key = st.secrets.get("MAPBOX_API_KEY")
 
+def _hash_positions(df):
+    """Empreinte d'un DataFrame limitée aux coordonnées des bornes."""
+    return int(pd.util.hash_pandas_object(df[['lat', 'lon']]).sum())
+
+
+@st.cache_resource(max_entries=16, hash_funcs={pd.DataFrame: _hash_positions})
+def build_deck(df, map_style, mapbox_api_key):
+    """
+    Construit l'objet Deck (vue, couche, tooltip).
+    Mis en cache : réutilisé tant que les bornes affichées et le style ne changent pas.
+    """
     view_state = pdk.ViewState(
         latitude=46.71109,
         longitude=1.71910,
@@ -25,32 +45,84 @@ def get_pydeck_map(df, map_style='mapbox://styles/mapbox/navigation-day-v1'):
         max_zoom=12
     )
 
-    layer = pdk.Layer(
-        'ScatterplotLayer',
-        data=df[['lon', 'lat', 'nom_station']],
-        get_position='[lon, lat]',
-        get_color='[255, 0, 0, 180]',
-        get_radius=250,
-        stroked=True,
-        get_line_color=[255, 255, 255, 100],
-        get_line_width=3,
-        auto_highlight=True,
-        pickable=True
-    )
-
-    tooltip = {
-        "html": "<b>{nom_station}</b><br/>Lat: {lat}<br/>Lon: {lon}",
-        "style": {"backgroundColor": "steelblue", "color": "white"}
-    }
+    if len(df) > MAX_SCATTER_POINTS:
+        # Trop de points pour un nuage lisible : hexagones sur données pré-agrégées
+        layer = pdk.Layer(
+            'HexagonLayer',
+            data=bin_points(df),
+            get_position='[lon, lat]',
+            get_color_weight='count',
+            color_aggregation='SUM',
+            get_elevation_weight='count',
+            elevation_aggregation='SUM',
+            radius=2000,
+            elevation_scale=20,
+            extruded=False,
+            auto_highlight=True,
+            pickable=True
+        )
+        tooltip = {
+            "html": "<b>{colorValue}</b> bornes",
+            "style": {"backgroundColor": "steelblue", "color": "white"}
+        }
+    else:
+        layer = pdk.Layer(
+            'ScatterplotLayer',
+            data=df[['lon', 'lat', 'nom_station']],
+            get_position='[lon, lat]',
+            get_color='[255, 0, 0, 180]',
+            get_radius=250,
+            stroked=True,
+            get_line_color=[255, 255, 255, 100],
+            get_line_width=3,
+            auto_highlight=True,
+            pickable=True
+        )
+        tooltip = {
+            "html": "<b>{nom_station}</b><br/>Lat: {lat}<br/>Lon: {lon}",
+            "style": {"backgroundColor": "steelblue", "color": "white"}
+        }
 
-    deck = pdk.Deck(
+    return pdk.Deck(
         map_style=map_style,
         initial_view_state=view_state,
         layers=[layer],
         tooltip=tooltip,
         api_keys={'mapbox': mapbox_api_key}
     )
-    st.pydeck_chart(deck, width='stretch')
+
+
+def get_pydeck_map(df, map_style='mapbox://styles/mapbox/navigation-day-v1'):
+    """
+    Crée une carte Pydeck centrée sur la France avec les points des bornes.
+    Utilise la clé API Mapbox des secrets Streamlit.
+    """
+    if df.empty:
+        st.warning("Aucune donnée à afficher sur la carte pour les filtres sélectionnés.")
+        return
+
+    # Récupère la clé API
+    mapbox_api_key = st.secrets.get("MAPBOX_API_KEY")
+
+    st.pydeck_chart(build_deck(df, map_style, mapbox_api_key), width='stretch')
+
+
+def top_counts(series, n=10):
+    """
+    Renvoie les n modalités les plus fréquentes d'une colonne catégorielle.
+    Compte sur les codes entiers (np.bincount) plutôt qu'en hachant les chaînes.
+    """
+    categories = series.cat.categories
+    codes = series.cat.codes.to_numpy()
+    counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+
+    # Seules les modalités présentes dans les données filtrées sont retenues
+    top = np.flatnonzero(counts)
+    if top.size > n:
+        top = top[np.argpartition(-counts[top], n)[:n]]
+    top = top[np.argsort(-counts[top], kind='stable')]
+
+    return pd.DataFrame({series.name: categories[top], 'count': counts[top]})
 
 
 def get_plotly_bar_chart(df, column, title):
@@ -59,8 +131,11 @@ def get_plotly_bar_chart(df, column, title):
         return
 
     # Compter les valeurs
-    data_counts = df[column].value_counts().head(10).reset_index()
-    data_counts.columns = [column, 'count']
+    if isinstance(df[column].dtype, pd.CategoricalDtype):
+        data_counts = top_counts(df[column])
+    else:
+        data_counts = df[column].value_counts().head(10).reset_index()
+        data_counts.columns = [column, 'count']
 
     fig = px.bar(
         data_counts,
@@ -78,17 +153,17 @@ def get_plotly_hist(df, column, title):
         st.warning(f"Aucune donnée de puissance à afficher pour : {title}")
         return
 
-    max_val = df[column].max()
-    if pd.isna(max_val) or max_val == 0:
-        max_val = 10
+    # Binning côté serveur : seuls les 20 effectifs sont envoyés au navigateur
+    values = df[column].dropna().to_numpy()
+    counts, edges = np.histogram(values, bins=20)
+    centers = 0.5 * (edges[:-1] + edges[1:])
 
-    # Création de l'histogramme avec Plotly
-    fig = px.histogram(
-        df,
-        x=column,
-        nbins=20,  # Nombre de "bacs"
+    fig = px.bar(
+        x=centers,
+        y=counts,
         title=title,
-        labels={column: 'Puissance (kW)'}
+        labels={'x': 'Puissance (kW)', 'y': 'Nombre de bornes'}
     )
-    fig.update_layout(bargap=0.1)
-    st.plotly_chart(fig, width='stretch')
\ No newline at end of file
+    fig.update_traces(width=(edges[1] - edges[0]) * 0.9)
+    fig.update_layout(bargap=0.05)
+    st.plotly_chart(fig, width='stretch')